@@ -0,0 +1,142 @@
+"""Convert the scikit‑learn models in this directory to ONNX.
+
+``ThreatClassifier`` prefers ``predictor.onnx`` and ``pt_predictor.onnx``
+over the joblib pipelines when ``onnxruntime`` is installed, which moves
+inference off the scikit‑learn dispatch path.  Run this script with
+``skl2onnx`` and ``onnxruntime`` installed every time the joblib models are
+retrained:
+
+    python Classifier/export_onnx.py
+
+Every export is compared with its joblib model on a sample of inputs,
+including non‑ASCII text, and is only written when all predictions agree;
+otherwise any previous export is removed so that the joblib model is used.
+
+The text model is exported for the input ``ThreatClassifier`` feeds it,
+text normalised by ``WAF/normalize.py``, which is lower‑cased already:
+the ``StringNormalizer`` skl2onnx emits for lower‑casing is dropped, as it
+also requires the ``en_US.UTF-8`` locale at runtime.  Its tokenizer uses a
+character class equivalent to Python's Unicode ``\\w`` on the interpreter
+running this script, instead of the ASCII ``[a-zA-Z0-9_]+`` skl2onnx
+substitutes for the default ``token_pattern``.
+"""
+
+import os
+import random
+import re
+import string
+import sys
+
+import joblib
+import numpy as np
+import onnxruntime as ort
+from skl2onnx import convert_sklearn
+from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+
+TARGET_OPSET = 17
+HERE = os.path.dirname(os.path.abspath(__file__))
+# scikit‑learn's default token pattern, ``(?u)\b\w\w+\b``
+DEFAULT_TOKEN_PATTERN = r'(?u)\b\w\w+\b'
+
+
+def _word_class() -> str:
+    """Return an RE2 character class matching exactly what ``\\w`` matches."""
+    parts = []
+    start = None
+    for code in range(sys.maxunicode + 2):
+        is_word = code <= sys.maxunicode and re.match(r'\w', chr(code)) is not None
+        if is_word and start is None:
+            start = code
+        elif not is_word and start is not None:
+            end = code - 1
+            parts.append(f'\\x{{{start:x}}}' if start == end else f'\\x{{{start:x}}}-\\x{{{end:x}}}')
+            start = None
+    return '[' + ''.join(parts) + ']'
+
+
+def _drop_lowercasing(onx) -> None:
+    """Remove the ``StringNormalizer`` nodes, wiring their input through."""
+    graph = onx.graph
+    for node in list(graph.node):
+        if node.op_type != 'StringNormalizer':
+            continue
+        source, target = node.input[0], node.output[0]
+        graph.node.remove(node)
+        for other in graph.node:
+            for idx, name in enumerate(other.input):
+                if name == target:
+                    other.input[idx] = source
+
+
+def _text_sample(model) -> list:
+    """Normalised texts exercising the tokenizer around every character."""
+    vectorizer = model.steps[0][1]
+    words = sorted(vectorizer.vocabulary_)
+    rng = random.Random(0)
+    # every code point (but surrogates) between two vocabulary words
+    first, second = rng.sample(words, 2)
+    sample = [
+        f'{first}{chr(code)}{second}' for code in range(sys.maxunicode + 1)
+        if not 0xD800 <= code <= 0xDFFF
+    ]
+    # vocabulary words mixed with ASCII separators and non‑ASCII characters
+    pieces = list(string.punctuation + ' ') + ['é', 'ß', 'ı', 'ǅ', '٣', '中', '½', '́', ' ']
+    for _ in range(50_000):
+        parts = []
+        for _ in range(rng.randint(1, 8)):
+            kind = rng.random()
+            if kind < 0.5:
+                parts.append(rng.choice(words))
+            elif kind < 0.8:
+                parts.append(rng.choice(pieces))
+            else:
+                code = rng.randrange(0x80, sys.maxunicode + 1)
+                parts.append(chr(code) if not 0xD800 <= code <= 0xDFFF else 'é')
+        sample.append(''.join(parts))
+    return [text.lower() for text in sample]
+
+
+def export(name: str, model, input_type, sample, options=None) -> bool:
+    """Export ``model`` to ``<name>.onnx`` if both predict alike on ``sample``.
+
+    Returns whether the export was written.
+    """
+    onx = convert_sklearn(model, initial_types=[('input', input_type)], target_opset=TARGET_OPSET, options=options)
+    _drop_lowercasing(onx)
+    session = ort.InferenceSession(onx.SerializeToString(), providers=['CPUExecutionProvider'])
+    expected = model.predict(sample)
+    dtype = object if isinstance(input_type, StringTensorType) else np.float32
+    inputs = np.asarray(sample, dtype=dtype).reshape(-1, 1)
+    actual = session.run([session.get_outputs()[0].name], {'input': inputs})[0]
+    mismatches = np.flatnonzero(expected != actual)
+    path = os.path.join(HERE, name + '.onnx')
+    if len(mismatches):
+        print(f"{name}: {len(mismatches)} of {len(expected)} predictions differ, keeping the joblib model")
+        for idx in mismatches[:5]:
+            print(f"  {sample[idx]!r}: {expected[idx]} != {actual[idx]}")
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    with open(path, 'wb') as f:
+        f.write(onx.SerializeToString())
+    print(f"{name}: {len(expected)} predictions agree, wrote {path}")
+    return True
+
+
+def main() -> None:
+    # the text classifier takes one request string per row, the parameter
+    # tampering classifier one value length per row
+    text_model = joblib.load(os.path.join(HERE, 'predictor.joblib'))
+    vectorizer = text_model.steps[0][1]
+    if vectorizer.token_pattern != DEFAULT_TOKEN_PATTERN:
+        raise SystemExit(f"predictor: unsupported token_pattern {vectorizer.token_pattern!r}")
+    export(
+        'predictor', text_model, StringTensorType([None, 1]), _text_sample(text_model),
+        options={type(vectorizer): {'tokenexp': _word_class() + '{2,}'}},
+    )
+    length_model = joblib.load(os.path.join(HERE, 'pt_predictor.joblib'))
+    export('pt_predictor', length_model, FloatTensorType([None, 1]), np.arange(0, 10_001, dtype=np.float32).reshape(-1, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Helpers for grouping work items taken from a queue into batches.
+
+Both the sniffer and the persistence layer process requests in groups to
+amortise fixed per-call costs.  A batch is closed as soon as it holds
+``max_batch_size`` items or ``max_batch_duration`` seconds have elapsed
+since its first item arrived, whichever comes first.  ``None`` is used as
+the sentinel that tells a consumer to stop.
+"""
+
+import queue
+import time
+from typing import Any, List
+
+
+def drain(q: queue.Queue, max_batch_size: int, max_batch_duration: float) -> List[Any]:
+    """Block until an item is available and return the batch it starts.
+
+    The sentinel ``None`` closes the batch immediately and is returned as
+    its last element.
+    """
+    batch = [q.get()]
+    deadline = time.monotonic() + max_batch_duration
+    while batch[-1] is not None and len(batch) < max_batch_size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(q.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
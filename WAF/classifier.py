@@ -15,144 +15,297 @@ phases:
    attacks based on the length of parameter values.  The models are loaded
    from ``../Classifier/predictor.joblib`` and ``../Classifier/pt_predictor.joblib``.  If
    the models cannot be loaded a fallback is used that always predicts
-   ``'valid'``.
+   ``'valid'``.  When ``onnxruntime`` is installed and ONNX exports of the
+   models exist next to them (see ``Classifier/export_onnx.py``) those are
+   run instead, avoiding the scikit‑learn dispatch cost on every call.
+
+Requests can be classified one at a time with ``classify_request`` or in
+groups with ``classify_batch``; the latter invokes each model once for the
+whole group, amortising the per-call overhead of scikit‑learn.
+
+The signature engine runs on every request.  The results of the
+machine‑learning phase are memoised in an LRU cache keyed on a digest of
+the normalised request parts the models look at.  Digits are folded to ``0`` before
+hashing, so requests differing only in numeric values (``?id=12345`` and
+``?id=67890``) share an entry; value lengths are preserved so parameter
+tampering decisions are unaffected.  Every ``refresh_interval``‑th hit is
+treated as a miss to re‑verify the cached result.
 """
 
 from __future__ import annotations
 
+import hashlib
 import json
-import urllib.parse
-from typing import Dict, Any
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 
 import joblib  # scikit‑learn includes joblib
+import numpy as np
+
+try:
+    import onnxruntime as ort  # optional: compiled inference of the models
+except ImportError:  # pragma: no cover - depends on the host
+    ort = None
 
+from .normalize import clean_text
 from .request import Request
 from .rule_engine import scan_request
 
 
+class _OnnxModel:
+    """Runs an ONNX export of a classifier behind the scikit‑learn ``predict`` API.
+
+    The exported models take a single column of inputs, one row per sample,
+    and return the predicted labels as their first output.  The text model
+    expects text normalised by `clean_text`; its export leaves out the
+    lower‑casing done by the scikit‑learn pipeline.
+    """
+
+    def __init__(self, path: str, dtype: Any) -> None:
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.label_name = self.session.get_outputs()[0].name
+        self.dtype = dtype
+
+    def predict(self, X: Any) -> np.ndarray:
+        inputs = np.asarray(X, dtype=self.dtype).reshape(-1, 1)
+        return self.session.run([self.label_name], {self.input_name: inputs})[0]
+
+
+def _load_model(name: str, dtype: Any) -> Any:
+    """Load ``../Classifier/<name>`` preferring its ONNX export.
+
+    Returns ``None`` when neither the ONNX nor the joblib model can be loaded.
+    """
+    if ort is not None:
+        try:
+            return _OnnxModel(f"../Classifier/{name}.onnx", dtype)
+        except Exception:
+            pass
+    try:
+        return joblib.load(f"../Classifier/{name}.joblib")
+    except Exception:
+        return None
+
+
+# Folds every digit to '0' so that numeric values only differing in their
+# digits produce the same cache key.
+_FOLD_DIGITS = str.maketrans('123456789', '000000000')
+
+
+class _ResultCache:
+    """Thread‑safe LRU mapping from request digests to threat dictionaries."""
+
+    def __init__(self, maxsize: int, refresh_interval: int) -> None:
+        self.maxsize = maxsize
+        self.refresh_interval = refresh_interval
+        self._entries: OrderedDict = OrderedDict()
+        self._hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[Dict[str, str]]:
+        """Return a copy of the cached threats or ``None`` on a miss."""
+        with self._lock:
+            threats = self._entries.get(key)
+            if threats is None:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            if self.refresh_interval and self._hits % self.refresh_interval == 0:
+                return None  # sampled hit: let the caller re‑verify the entry
+            return dict(threats)
+
+    def put(self, key: bytes, threats: Dict[str, str]) -> None:
+        with self._lock:
+            self._entries[key] = dict(threats)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
 class ThreatClassifier:
     """Combines signature matching and machine‑learning for threat detection."""
 
-    def __init__(self) -> None:
+    def __init__(self, cache_size: int = 100_000, refresh_interval: int = 64) -> None:
         # Attempt to load ML models.  If they are missing fall back to None.
+        self.clf = _load_model('predictor', object)
+        self.pt_clf = _load_model('pt_predictor', np.float32)
+        self.cache = _ResultCache(cache_size, refresh_interval) if cache_size > 0 else None
+        # Set once the warm-up below has finished; consumers should wait on
+        # it before classifying live traffic.
+        self.ready = threading.Event()
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self) -> None:
+        """Pay one-off first-call costs (JIT compilation, lazy allocations)
+        with dummy inputs so that the first real request does not."""
         try:
-            self.clf = joblib.load("../Classifier/predictor.joblib")
-        except Exception:
-            self.clf = None
-        try:
-            self.pt_clf = joblib.load("../Classifier/pt_predictor.joblib")
+            clean_text('/?q=%20')
         except Exception:
-            self.pt_clf = None
-
-    @staticmethod
-    def _clean_text(text: str) -> str:
-        """Utility function for cleaning and normalising input strings."""
-        if text is None:
-            return ''
-        # unquote repeatedly and collapse whitespace
-        prev = text
-        for _ in range(5):
-            decoded = urllib.parse.unquote_plus(prev)
-            if decoded == prev:
-                break
-            prev = decoded
-        return ' '.join(prev.strip().split()).lower()
+            pass
+        if self.clf is not None:
+            try:
+                self.clf.predict(['get /'] * 4)
+            except Exception:
+                pass
+        if self.pt_clf is not None:
+            try:
+                self.pt_clf.predict(np.array([[10], [20], [30], [40]], dtype=np.float32))
+            except Exception:
+                pass
+        self.ready.set()
 
     @staticmethod
     def _is_valid(parameter: Any) -> bool:
         return parameter is not None and parameter != ''
 
+    def _cache_key(self, req: Request) -> bytes:
+        """Digest of every request part the models look at."""
+        parts = [
+            req.request_clean,
+            req.body_clean,
+            req.header_clean('Cookie'),
+            req.header_clean('User_Agent'),
+            req.header_clean('Accept_Encoding'),
+            req.header_clean('Accept_Language'),
+        ]
+        text = '\0'.join(parts).translate(_FOLD_DIGITS)
+        return hashlib.blake2b(text.encode('utf-8', 'replace'), digest_size=16).digest()
+
     def classify_request(self, req: Request) -> None:
         """Populate the request with detected threat labels."""
-        if not isinstance(req, Request):
-            raise TypeError("Object should be a Request!")
+        self.classify_batch([req])
 
-        # First run the rule engine.  If any threats are returned skip ML.
-        signature_threats = scan_request(req)
-        if signature_threats:
-            req.threats = signature_threats
+    def classify_batch(self, reqs: List[Request]) -> None:
+        """Populate every request of the batch with detected threat labels.
+
+        Signatures are matched per request.  The requests they leave
+        unflagged are served from the cache when possible; the rest are
+        classified together so that each model is invoked once per batch
+        instead of once per request.
+        """
+        for req in reqs:
+            if not isinstance(req, Request):
+                raise TypeError("Object should be a Request!")
+        # First run the rule engine.  Requests with threats skip ML.
+        pending: List[Request] = []
+        for req in reqs:
+            signature_threats = scan_request(req)
+            if signature_threats:
+                req.threats = signature_threats
+            else:
+                req.threats = {}
+                pending.append(req)
+        if self.cache is None:
+            self._predict(pending)
             return
 
-        # Otherwise perform ML classification
-        req.threats = {}
-        parameters: list = []
-        locations: list = []
+        misses: List[Request] = []
+        keys: List[bytes] = []
+        for req in pending:
+            key = self._cache_key(req)
+            threats = self.cache.get(key)
+            if threats is not None:
+                req.threats = threats
+            else:
+                misses.append(req)
+                keys.append(key)
+        self._predict(misses)
+        for req, key in zip(misses, keys):
+            self.cache.put(key, req.threats)
 
-        # Collect raw features for text classifier
-        if self._is_valid(req.request):
-            parameters.append(self._clean_text(req.request))
-            locations.append('Request')
-        if self._is_valid(req.body):
-            parameters.append(self._clean_text(req.body))
-            locations.append('Body')
-        if 'Cookie' in req.headers and self._is_valid(req.headers.get('Cookie')):
-            parameters.append(self._clean_text(req.headers['Cookie']))
-            locations.append('Cookie')
-        if 'User_Agent' in req.headers and self._is_valid(req.headers.get('User_Agent')):
-            parameters.append(self._clean_text(req.headers['User_Agent']))
-            locations.append('User Agent')
-        if 'Accept_Encoding' in req.headers and self._is_valid(req.headers.get('Accept_Encoding')):
-            parameters.append(self._clean_text(req.headers['Accept_Encoding']))
-            locations.append('Accept Encoding')
-        if 'Accept_Language' in req.headers and self._is_valid(req.headers.get('Accept_Language')):
-            parameters.append(self._clean_text(req.headers['Accept_Language']))
-            locations.append('Accept Language')
+    def _predict(self, pending: List[Request]) -> None:
+        """Run the models on requests no signature matched."""
+        if not pending:
+            return
 
-        # Text classification
+        # Text classification: one row per (request, location) pair
+        parameters: list = []
+        owners: List[Tuple[Request, str]] = []
+        for req in pending:
+            for text, location in self._text_features(req):
+                parameters.append(text)
+                owners.append((req, location))
         if parameters and self.clf is not None:
             try:
                 predictions = self.clf.predict(parameters)
-                for idx, pred in enumerate(predictions):
+                for (req, location), pred in zip(owners, predictions):
                     if pred != 'valid':
-                        req.threats[pred] = locations[idx]
+                        req.threats[pred] = location
             except Exception:
                 # fall back to no threats if prediction fails
                 pass
 
-        # Parameter tampering classification: build length features
-        request_parameters: Dict[str, list] = {}
-        if self._is_valid(req.request):
+        # Parameter tampering classification on the length of every value
+        values: List[str] = []
+        owners = []
+        for req in pending:
+            for value, location in self._parameter_values(req):
+                values.append(value)
+                owners.append((req, location))
+        if values and self.pt_clf is not None:
+            # one contiguous column of lengths, in the float32 dtype the
+            # decision tree (and its ONNX export) works with
+            length_features = np.fromiter(map(len, values), dtype=np.float32, count=len(values)).reshape(-1, 1)
             try:
-                request_parameters = urllib.parse.parse_qs(self._clean_text(req.request))
+                pt_preds = self.pt_clf.predict(length_features)
+                for (req, location), pred in zip(owners, pt_preds):
+                    if pred != 'valid':
+                        req.threats[pred] = location
             except Exception:
-                request_parameters = {}
+                pass
+
+        # If nothing has been flagged mark request as valid
+        for req in pending:
+            if not req.threats:
+                req.threats['valid'] = ''
+
+    def _text_features(self, req: Request) -> List[Tuple[str, str]]:
+        """Return the cleaned texts fed to the text classifier with their location."""
+        features: List[Tuple[str, str]] = []
+        if self._is_valid(req.request):
+            features.append((req.request_clean, 'Request'))
+        if self._is_valid(req.body):
+            features.append((req.body_clean, 'Body'))
+        if 'Cookie' in req.headers and self._is_valid(req.headers.get('Cookie')):
+            features.append((req.header_clean('Cookie'), 'Cookie'))
+        if 'User_Agent' in req.headers and self._is_valid(req.headers.get('User_Agent')):
+            features.append((req.header_clean('User_Agent'), 'User Agent'))
+        if 'Accept_Encoding' in req.headers and self._is_valid(req.headers.get('Accept_Encoding')):
+            features.append((req.header_clean('Accept_Encoding'), 'Accept Encoding'))
+        if 'Accept_Language' in req.headers and self._is_valid(req.headers.get('Accept_Language')):
+            features.append((req.header_clean('Accept_Language'), 'Accept Language'))
+        return features
+
+    def _parameter_values(self, req: Request) -> List[Tuple[str, str]]:
+        """Return every query and body parameter value with its location."""
+        request_parameters: Dict[str, list] = {}
+        if self._is_valid(req.request):
+            request_parameters = req.query_params
         body_parameters: Dict[str, Any] = {}
         if self._is_valid(req.body):
-            try:
-                body_parameters = urllib.parse.parse_qs(self._clean_text(req.body))
-            except Exception:
-                body_parameters = {}
+            body_parameters = req.body_params
             if not body_parameters:
                 # Fallback to JSON decoding
                 try:
-                    body_parameters = json.loads(self._clean_text(req.body))
+                    body_parameters = json.loads(req.body_clean)
                 except Exception:
                     body_parameters = {}
+                if not isinstance(body_parameters, dict):
+                    body_parameters = {}
 
-        length_features = []
-        locations_len = []
+        values: List[Tuple[str, str]] = []
         for vals in request_parameters.values():
             for elem in vals:
-                length_features.append([len(elem)])
-                locations_len.append('Request')
+                values.append((elem, 'Request'))
         for name, value in body_parameters.items():
             if isinstance(value, list):
                 for elem in value:
-                    length_features.append([len(elem)])
-                    locations_len.append('Body')
+                    values.append((str(elem), 'Body'))
             else:
-                length_features.append([len(value)])
-                locations_len.append('Body')
-
-        if length_features and self.pt_clf is not None:
-            try:
-                pt_preds = self.pt_clf.predict(length_features)
-                for idx, pred in enumerate(pt_preds):
-                    if pred != 'valid':
-                        req.threats[pred] = locations_len[idx]
-            except Exception:
-                pass
-
-        # If nothing has been flagged mark request as valid
-        if not req.threats:
-            req.threats['valid'] = ''
\ No newline at end of file
+                values.append((str(value), 'Body'))
+        return values
@@ -7,12 +7,25 @@ table allows filtering by threat type or location.  Clicking on a pie
 segment filters the table, and a reset button clears the filters.  A Flask
 endpoint `/review/<id>` renders a Jinja2 template for inspecting an
 individual request record.
+
+Request JSON is read from memory maps of the NDJSON shards written by
+`DBController`, kept open for the most recently reviewed shards; it is
+parsed and pretty-printed with ``orjson`` when installed.
+
+All callbacks share one `DBController`, opened on first use and closed when
+the interpreter exits; reads through its connection are serialised.
 """
 
 from __future__ import annotations
 
+import atexit
+import contextlib
 import json
-import numpy as np
+import mmap
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional
+
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
@@ -24,32 +37,92 @@ from flask import Flask, render_template
 
 from .request import DBController
 
+try:
+    import orjson  # optional: faster JSON parsing and formatting
+except ImportError:  # pragma: no cover - depends on the host
+    orjson = None
+
 # List of possible threat labels used to filter
 POSSIBLE_ATTACKS = ['sqli', 'xss', 'cmdi', 'path-traversal', 'valid', 'parameter-tampering']
+# Labels grouped under 'attack' in the performed requests chart
+ATTACK_SET = frozenset(POSSIBLE_ATTACKS) - {'valid'}
+
+# Database controller shared by every server thread
+_db: Optional[DBController] = None
+_db_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def database() -> Iterator[DBController]:
+    """Yield the shared `DBController`, opening it on first use.
+
+    The lock is held for the duration of the ``with`` block, serialising
+    access to the controller's connection.
+    """
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = DBController()
+        yield _db
+
+
+@atexit.register
+def _close_database() -> None:
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+# Memory maps of the request log shards, least recently used first
+MAX_OPEN_SHARDS = 16
+_shards: OrderedDict = OrderedDict()
+_shards_lock = threading.Lock()
+
+
+def read_shard(path: str, offset: int, length: int) -> bytes:
+    """Return ``length`` bytes at ``offset`` of the shard at ``path``."""
+    end = offset + length
+    with _shards_lock:
+        mm = _shards.get(path)
+        if mm is None or len(mm) < end:
+            # map the shard again once it has grown past the mapped size
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            _shards[path] = mm
+        _shards.move_to_end(path)
+        if len(_shards) > MAX_OPEN_SHARDS:
+            _shards.popitem(last=False)
+        return mm[offset:end]
+
+
+def format_json(raw: bytes) -> str:
+    """Pretty-print a serialised JSON document."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(orjson.loads(raw), option=orjson.OPT_INDENT_2).decode()
+        except ValueError:
+            pass  # e.g. escaped lone surrogates, which json accepts
+    return json.dumps(json.loads(raw), indent=4)
 
 
 def generate_figure(df):
     """Generate a Plotly figure with three pie charts summarising the data."""
     fig = make_subplots(rows=1, cols=3, specs=[[{'type': 'domain'}, {'type': 'domain'}, {'type': 'domain'}]])
     fig.layout['clickmode'] = 'event+select'
+    # Threat counts are computed once, on categorical codes, and shared by
+    # the first two charts
+    counts = df['threat_type'].astype('category').value_counts()
     # Pie chart for performed requests: group all attacks under 'attack'
-    valid_data = df.replace(['sqli', 'xss', 'cmdi', 'path-traversal', 'parameter-tampering'], 'attack')
-    data_pie = valid_data['threat_type'].value_counts().to_frame()
-    data_pie['type'] = list(data_pie.index)
-    data_pie = data_pie.rename(columns={"threat_type": "count"})
-    fig.add_trace(go.Pie(labels=data_pie['type'], values=data_pie['count'], title='Performed requests', textposition='inside', textinfo='percent+label'), 1, 1)
+    performed = counts.groupby(counts.index.map(lambda t: 'attack' if t in ATTACK_SET else t), observed=True).sum()
+    fig.add_trace(go.Pie(labels=performed.index, values=performed.values, title='Performed requests', textposition='inside', textinfo='percent+label'), 1, 1)
     # Pie chart for performed attacks
-    attack_data = df[df['threat_type'] != 'valid']
-    data_pie = attack_data['threat_type'].value_counts().to_frame()
-    data_pie['type'] = list(data_pie.index)
-    data_pie = data_pie.rename(columns={"threat_type": "count"})
-    fig.add_trace(go.Pie(labels=data_pie['type'], values=data_pie['count'], title='Performed attacks', textposition='inside', textinfo='percent+label'), 1, 2)
+    attacks = counts[counts.index != 'valid']
+    fig.add_trace(go.Pie(labels=attacks.index, values=attacks.values, title='Performed attacks', textposition='inside', textinfo='percent+label'), 1, 2)
     # Pie chart for location of attacks
-    data_pie = df['location'].value_counts().to_frame()
-    data_pie['type'] = list(data_pie.index)
-    data_pie = data_pie.rename(columns={"location": "count"})
-    data_pie = data_pie.replace('', np.nan).dropna()
-    fig.add_trace(go.Pie(labels=data_pie['type'], values=data_pie['count'], title='Locations of attacks', textposition='inside', textinfo='percent+label'), 1, 3)
+    locations = df['location'].astype('category').value_counts().drop('', errors='ignore')
+    fig.add_trace(go.Pie(labels=locations.index, values=locations.values, title='Locations of attacks', textposition='inside', textinfo='percent+label'), 1, 3)
     return dcc.Graph(id='example-graph1', figure=fig)
 
 
@@ -118,9 +191,8 @@ app.layout = html.Div(children=[
 def display_hover_data(hoverData, n_clicks):
     ctx = dash.callback_context
     component_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
-    db = DBController()
-    raw_data = db.read_all()
-    db.close()
+    with database() as db:
+        raw_data = db.read_all()
     label = None
     if component_id == 'example-graph1' and hoverData:
         label = hoverData['points'][0]['label']
@@ -134,12 +206,16 @@ def index():
 
 @server.route('/review/<int:request_id>', methods=['GET'])
 def review_request(request_id: int):
+    with database() as db:
+        log, data = db.read_request(int(request_id))
     # Load request body
-    with open(f'./requests_log/{request_id}.json', 'r') as f:
-        request_json = json.dumps(json.load(f), indent=4)
-    db = DBController()
-    log, data = db.read_request(int(request_id))
-    db.close()
+    if log.get('shard') is not None:
+        raw = read_shard(log['shard'], log['body_offset'], log['body_len'])
+    else:
+        # logged before the NDJSON shards were introduced
+        with open(f'./requests_log/{request_id}.json', 'rb') as f:
+            raw = f.read()
+    request_json = format_json(raw)
     return render_template('request.html', id=str(request_id), request=request_json, num_attacks=len(data), attacks=data, log=log)
 
 
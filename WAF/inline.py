@@ -0,0 +1,68 @@
+"""Inline mode: inspect requests inside the web application instead of sniffing.
+
+Passive capture with Scapy reassembles and dissects every packet in Python,
+which bounds the throughput of `sniffing.py`.  When the protected service is
+a Flask application the WAF can run inside it instead: a ``before_request``
+hook builds a `Request` directly from ``flask.request``, classifies it via
+`ThreatClassifier` and hands it to `DBController`.  No packets are captured,
+so no elevated privileges are needed.  Running this module serves the test
+REST service from `rest_app.py` this way.
+"""
+
+from __future__ import annotations
+import os
+import urllib.parse
+from argparse import ArgumentParser
+
+from flask import Flask, request as http_request
+
+from .classifier import ThreatClassifier
+from .request import Request, DBController
+from .rest_app import app as rest_app
+
+
+def request_from_flask() -> Request:
+    """Build a `Request` from the request Flask is currently handling."""
+    req = Request()
+    req.origin = http_request.remote_addr or 'localhost'
+    req.host = http_request.host
+    # prefer the raw request target, as the sniffer sees it on the wire
+    target = http_request.environ.get('RAW_URI') or http_request.full_path.rstrip('?')
+    req.request = urllib.parse.unquote(target)
+    req.method = http_request.method
+    # use the header names produced by Scapy (User-Agent -> User_Agent)
+    req.headers = {name.replace('-', '_'): value for name, value in http_request.headers.items()}
+    req.body = http_request.get_data(as_text=True)
+    return req
+
+
+def install(app: Flask, threat_clf: ThreatClassifier, db: DBController) -> None:
+    """Classify and log every request served by ``app``."""
+
+    @app.before_request
+    def inspect_request() -> None:
+        req = request_from_flask()
+        threat_clf.classify_request(req)
+        db.save(req)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Test REST service with the WAF inline")
+    parser.add_argument('--port', type=int, default=5000, help='Port to serve on')
+    args = parser.parse_args()
+
+    # the models (../Classifier), log.db and requests_log/ are resolved
+    # against the working directory, which the dashboard expects to be WAF/
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    db = DBController()
+    threat_clf = ThreatClassifier()
+    install(rest_app, threat_clf, db)
+    threat_clf.ready.wait()
+    try:
+        rest_app.run(port=args.port)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Normalisation of request text before it is matched or classified.
+
+Both the signature engine and the ML classifier work on a canonical form of
+every request part: percent‑encoding (including ``+`` for spaces) is decoded
+repeatedly until the text stops changing, at most five times, runs of
+whitespace are collapsed into a single space and the result is lower‑cased.
+
+When ``numba`` is installed ASCII input containing escapes is normalised by
+a compiled kernel that performs all of these steps over a byte buffer,
+folding case and whitespace through a single translation table.  Text
+without escapes, and text that is, or decodes to, non‑ASCII, takes the
+reference implementation built on ``urllib.parse`` and the ``str`` methods,
+so Unicode whitespace and case folding are handled exactly as before.
+"""
+
+import urllib.parse
+
+import numpy as np
+
+try:
+    from numba import njit  # optional: compiled normalisation kernel
+except ImportError:  # pragma: no cover - depends on the host
+    njit = None
+
+# Maximum number of percent‑decoding rounds applied to a piece of text.
+MAX_UNQUOTE_ROUNDS = 5
+
+# Byte translation table folding A-Z to a-z and mapping every ASCII
+# character ``str.split()`` treats as whitespace to a space.
+_FOLD = bytes.maketrans(
+    bytes(range(ord('A'), ord('Z') + 1)) + b'\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f',
+    bytes(range(ord('a'), ord('z') + 1)) + b' ' * 9,
+)
+
+
+def _unquote(text: str) -> str:
+    """Repeatedly decode percent‑encoded text until it stops changing."""
+    prev = text
+    for _ in range(MAX_UNQUOTE_ROUNDS):  # limit depth to avoid pathological cases
+        if '%' not in prev and '+' not in prev:
+            break  # nothing left to decode
+        decoded = urllib.parse.unquote_plus(prev)
+        if decoded == prev:
+            break
+        prev = decoded
+    return prev
+
+
+def _clean_reference(text: str) -> str:
+    # unquote, collapse whitespace and lower‑case
+    return ' '.join(_unquote(text).split()).lower()
+
+
+if njit is not None:
+    _FOLD_TABLE = np.frombuffer(_FOLD, dtype=np.uint8)
+
+    @njit(cache=True)
+    def _hex_value(c):
+        if 48 <= c <= 57:
+            return c - 48
+        if 65 <= c <= 70:
+            return c - 55
+        if 97 <= c <= 102:
+            return c - 87
+        return -1
+
+    @njit(cache=True)
+    def _clean_bytes(buf, fold):
+        """Decode, collapse whitespace and fold case of an ASCII buffer."""
+        src = buf
+        n = src.shape[0]
+        for _ in range(MAX_UNQUOTE_ROUNDS):
+            out = np.empty(n, np.uint8)
+            changed = False
+            i = 0
+            j = 0
+            while i < n:
+                c = src[i]
+                if c == 43:  # '+'
+                    c = 32
+                    changed = True
+                elif c == 37 and i + 2 < n:  # '%XX'
+                    hi = _hex_value(src[i + 1])
+                    lo = _hex_value(src[i + 2])
+                    if hi >= 0 and lo >= 0:
+                        c = hi * 16 + lo
+                        changed = True
+                        i += 2
+                out[j] = c
+                i += 1
+                j += 1
+            if not changed:
+                break
+            src = out
+            n = j
+        # fold through the table, then collapse whitespace as str.split() does
+        out = np.empty(n, np.uint8)
+        j = 0
+        space = False
+        for i in range(n):
+            c = fold[src[i]]
+            if c == 32:
+                space = j > 0
+                continue
+            if space:
+                out[j] = 32
+                j += 1
+                space = False
+            out[j] = c
+            j += 1
+        return out[:j]
+else:
+    _clean_bytes = None
+
+
+def clean_text(text: str) -> str:
+    """Return the canonical form of ``text`` (``''`` for ``None``)."""
+    if text is None:
+        return ''
+    # text without escapes only needs the C‑level split/join/lower of the
+    # reference path; the kernel pays off once there is decoding to do
+    if _clean_bytes is not None and ('%' in text or '+' in text) and text.isascii():
+        out = _clean_bytes(np.frombuffer(text.encode('ascii'), dtype=np.uint8).copy(), _FOLD_TABLE).tobytes()
+        if out.isascii():
+            return out.decode('ascii')
+    return _clean_reference(text)
@@ -6,19 +6,45 @@ This module defines two classes:
   attributes and eventually a dictionary of detected threats;
 * `DBController` – a thin wrapper around an SQLite database for persisting
   incoming requests and their associated threat labels.  Each request is
-  serialised as JSON in the `requests_log/` directory and the metadata is
-  recorded in two tables (`logs` and `threats`).
+  serialised as one JSON line appended to a monthly shard in the
+  `requests_log/` directory and the metadata is recorded in two tables
+  (`logs` and `threats`).  Writes are queued and
+  committed in bulk by a background thread on a WAL‑mode database, so
+  saving a request never waits for the disk.
 
 The database schema is initialised externally (see the original project) and
 is compatible with the dashboard shipped with this repository.
 """
 
 import datetime
+import logging
+import queue
 import sqlite3
+import threading
 import pandas as pd
 import json
 import os
-from typing import Optional, Dict, Any
+import urllib.parse
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+from .batching import drain
+from .normalize import clean_text
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson  # optional: faster serialisation of the logged requests
+except ImportError:  # pragma: no cover - depends on the host
+    orjson = None
+
+
+def _dump_json(data: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass  # e.g. lone surrogates, which json escapes
+    return json.dumps(data).encode('utf-8')
 
 
 class Request:
@@ -29,8 +55,16 @@ class Request:
     headers, and a dictionary mapping detected threat types to the location
     (e.g. 'Body' or 'Cookie').  All attributes default to ``None`` until
     they are set by the sniffer.
+
+    The normalised request line, body and headers and the parsed query and
+    body parameters are computed on first access and cached, so that the
+    signature engine and the classifier share the work.  A cached value is
+    recomputed when the attribute it was derived from is reassigned.
     """
 
+    # one instance is created per observed request; slots keep it small
+    __slots__ = ('id', 'timestamp', 'origin', 'host', 'request', 'body', 'method', 'headers', 'threats', '_cache')
+
     def __init__(
         self,
         id: Optional[int] = None,
@@ -52,11 +86,41 @@ class Request:
         self.method = method
         self.headers = headers or {}
         self.threats = threats or {}
+        self._cache: Dict[str, Any] = {}
 
-    def to_json(self) -> str:
-        """Serialise the request to a JSON string containing all
-        non‑empty fields and headers.  This method is used when dumping
-        requests to disk for later inspection."""
+    def _cached(self, key: str, source: Any, compute: Callable[[Any], Any]) -> Any:
+        entry = self._cache.get(key)
+        if entry is None or entry[0] is not source:
+            entry = self._cache[key] = (source, compute(source))
+        return entry[1]
+
+    @property
+    def request_clean(self) -> str:
+        """The normalised request line."""
+        return self._cached('request_clean', self.request, clean_text)
+
+    @property
+    def body_clean(self) -> str:
+        """The normalised body."""
+        return self._cached('body_clean', self.body, clean_text)
+
+    def header_clean(self, name: str) -> str:
+        """The normalised value of header ``name`` (``''`` if missing)."""
+        return self._cached('header_clean:' + name, self.headers.get(name), clean_text)
+
+    @property
+    def query_params(self) -> Dict[str, List[str]]:
+        """``parse_qs`` of the normalised request line.  Do not modify."""
+        return self._cached('query_params', self.request_clean, urllib.parse.parse_qs)
+
+    @property
+    def body_params(self) -> Dict[str, List[str]]:
+        """``parse_qs`` of the normalised body.  Do not modify."""
+        return self._cached('body_params', self.body_clean, urllib.parse.parse_qs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a mapping of all non‑empty fields and headers.  This is
+        what gets dumped to disk for later inspection."""
         output: Dict[str, Any] = {}
         if self.request:
             output['request'] = self.request
@@ -65,7 +129,11 @@ class Request:
         # Include headers without mangling their names
         for header, value in (self.headers or {}).items():
             output[header] = value
-        return json.dumps(output)
+        return output
+
+    def to_json(self) -> str:
+        """Serialise `to_dict` to a JSON string."""
+        return json.dumps(self.to_dict())
 
 
 class DBController:
@@ -74,54 +142,183 @@ class DBController:
     Instances of this class manage a SQLite connection to the `log.db`
     database.  Requests are inserted into the `logs` table and each
     individual threat is inserted into the `threats` table.  When
-    persisting a request the JSON representation is also written to
-    `requests_log/<id>.json`.
+    persisting a request the JSON representation is also appended to
+    `requests_log/<YYYY-MM>.ndjson`; the shard path, byte offset and length
+    of the line are stored in the `shard`, `body_offset` and `body_len`
+    columns of `logs`.  Requests logged before the shards were introduced
+    have these columns unset and their JSON in `requests_log/<id>.json`.
+
+    `save` only queues the request.  A writer thread, started on the first
+    call, commits the queued requests in a single transaction once
+    ``max_batch_size`` of them are pending or ``max_batch_duration``
+    seconds have passed; `close` flushes whatever is still queued.  A batch
+    that cannot be written is retried one request at a time, so only the
+    offending requests are lost; failures are logged and `close` raises
+    once the queue is flushed if any request could not be saved.
     """
 
-    def __init__(self, db_path: str = "log.db") -> None:
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path: str = "log.db", max_batch_size: int = 256, max_batch_duration: float = 0.1) -> None:
+        self.db_path = db_path
+        self.max_batch_size = max_batch_size
+        self.max_batch_duration = max_batch_duration
+        # the connection may be closed from another thread than the one
+        # reading through it, e.g. by an atexit handler
+        self.conn = self._connect(check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        # lets the logs/threats join used by the dashboard use an index
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_threats_log_id ON threats(log_id)")
+        # databases created before the NDJSON shards lack their columns
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(logs)")}
+        for name, kind in (('shard', 'TEXT'), ('body_offset', 'INTEGER'), ('body_len', 'INTEGER')):
+            if name not in columns:
+                try:
+                    self.conn.execute(f"ALTER TABLE logs ADD COLUMN {name} {kind}")
+                except sqlite3.OperationalError:
+                    pass  # added by a concurrently opened controller
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        # first write error and number of requests lost, reported by close()
+        self._error: Optional[BaseException] = None
+        self._failed = 0
+
+    def _connect(self, **kwargs: Any) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, **kwargs)
+        # WAL lets readers proceed during bulk writes; NORMAL syncs on
+        # checkpoints instead of on every commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
 
     def save(self, obj: Request) -> None:
+        """Queue the request for persistence.
+
+        ``obj.id`` is assigned once the batch containing it is committed.
+        """
         if not isinstance(obj, Request):
             raise TypeError("Object should be a Request!")
-        cursor = self.conn.cursor()
         # assign a timestamp when saving
         obj.timestamp = datetime.datetime.now()
-        cursor.execute(
-            "INSERT INTO logs (timestamp, origin, host, method) VALUES (?, ?, ?, ?)",
-            (obj.timestamp, obj.origin, obj.host, obj.method),
-        )
-        obj.id = cursor.lastrowid
-        # write JSON representation to file
-        file_name = f"{obj.id}.json"
-        file_path = os.path.join('requests_log', file_name)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'w') as f:
-            json.dump(json.loads(obj.to_json()), f)
-        # insert associated threats
-        for threat, location in obj.threats.items():
+        with self._writer_lock:
+            # a writer that died unexpectedly is replaced; it resumes the queue
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, daemon=True)
+                self._writer.start()
+        self._queue.put(obj)
+
+    def _write_loop(self) -> None:
+        # the writer owns a dedicated connection with manual transactions
+        try:
+            conn = self._connect(isolation_level=None)
+            os.makedirs('requests_log', exist_ok=True)
+        except Exception as exc:
+            # the requests stay queued for the writer started by the next save
+            self._record_failure(exc, 0)
+            return
+        try:
+            while True:
+                batch = drain(self._queue, self.max_batch_size, self.max_batch_duration)
+                stop = batch[-1] is None
+                if stop:
+                    batch.pop()
+                if batch:
+                    self._write_safely(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _write_safely(self, conn: sqlite3.Connection, batch: List[Request]) -> None:
+        """Write the batch, isolating the requests that cannot be written."""
+        try:
+            self._write_batch(conn, batch)
+            return
+        except Exception as exc:
+            if len(batch) == 1:
+                self._record_failure(exc, 1)
+                return
+        for obj in batch:
+            try:
+                self._write_batch(conn, [obj])
+            except Exception as exc:
+                self._record_failure(exc, 1)
+
+    def _record_failure(self, exc: BaseException, lost: int) -> None:
+        logger.error("Failed to save %d request(s)", lost, exc_info=exc)
+        if self._error is None:
+            self._error = exc
+        self._failed += lost
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Request]) -> None:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # ids are assigned here so that both tables can be filled with
+            # executemany; the immediate transaction keeps them exclusive
             cursor.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'logs'), "
+                "(SELECT MAX(id) FROM logs), 0)"
+            )
+            last_id = cursor.fetchone()[0]
+            for offset, obj in enumerate(batch, 1):
+                obj.id = last_id + offset
+            # the JSON lines are on disk before their rows become visible
+            locations = self._append_json(batch)
+            cursor.executemany(
+                "INSERT INTO logs (id, timestamp, origin, host, method, shard, body_offset, body_len) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (obj.id, obj.timestamp, obj.origin, obj.host, obj.method, *location)
+                    for obj, location in zip(batch, locations)
+                ],
+            )
+            # insert associated threats
+            cursor.executemany(
                 "INSERT INTO threats (log_id, threat_type, location) VALUES (?, ?, ?)",
-                (obj.id, threat, location),
+                [(obj.id, threat, location) for obj in batch for threat, location in obj.threats.items()],
             )
-        self.conn.commit()
+            cursor.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _append_json(batch: List[Request]) -> List[Tuple[str, int, int]]:
+        """Append the JSON of every request to the shard of its month.
 
-    def _create_entry(self, row: sqlite3.Row) -> Dict[str, Any]:
-        entry = dict(row)
-        entry['Link'] = f"[Review](http://127.0.0.1:8050/review/{entry['id']})"
-        return entry
+        Returns the ``(shard, offset, length)`` of each line, excluding the
+        trailing newline.
+        """
+        locations: List[Tuple[str, int, int]] = []
+        files: Dict[str, Any] = {}
+        try:
+            for obj in batch:
+                shard = os.path.join('requests_log', obj.timestamp.strftime('%Y-%m') + '.ndjson')
+                f = files.get(shard)
+                if f is None:
+                    f = files[shard] = open(shard, 'ab')
+                line = _dump_json(obj.to_dict())
+                locations.append((shard, f.tell(), len(line)))
+                f.write(line + b'\n')
+        finally:
+            for f in files.values():
+                f.close()
+        return locations
 
     def read_all(self) -> pd.DataFrame:
         """Return a DataFrame with all stored requests and associated threats."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM logs AS l JOIN threats AS t ON l.id = t.log_id")
-        results = cursor.fetchall()
-        data = [self._create_entry(row) for row in results]
-        return pd.DataFrame(data)
+        df = pd.read_sql_query(
+            "SELECT l.id, l.timestamp, l.origin, l.host, l.method, t.log_id, t.threat_type, t.location "
+            "FROM logs AS l JOIN threats AS t ON l.id = t.log_id",
+            self.conn,
+        )
+        df['Link'] = '[Review](http://127.0.0.1:8050/review/' + df['id'].astype(str) + ')'
+        return df
 
-    def _create_single_entry(self, row: sqlite3.Row) -> list:
-        return [row['threat_type'], row['location']]
+    def _create_single_entry(self, row: sqlite3.Row) -> tuple:
+        return row['threat_type'], row['location']
 
     def read_request(self, id: int) -> tuple:
         """Return metadata and threats for a single request id."""
@@ -138,8 +335,25 @@ class DBController:
             log['origin'] = first['origin']
             log['host'] = first['host']
             log['method'] = first['method']
+            log['shard'] = first['shard']
+            log['body_offset'] = first['body_offset']
+            log['body_len'] = first['body_len']
         data = [self._create_single_entry(row) for row in results]
         return log, data
 
     def close(self) -> None:
-        self.conn.close()
\ No newline at end of file
+        """Flush the queued requests and close the database.
+
+        Raises ``RuntimeError`` if any request could not be saved.
+        """
+        with self._writer_lock:
+            writer = self._writer
+            self._writer = None
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join()
+        self.conn.close()
+        if self._error is not None:
+            error, failed = self._error, self._failed
+            self._error, self._failed = None, 0
+            raise RuntimeError(f"{failed} request(s) could not be saved") from error
\ No newline at end of file
@@ -10,75 +10,355 @@ If a request matches any signature the engine returns a dictionary mapping
 the detected threat type (e.g. ``'sqli'``) to the part of the request in
 which it was found (e.g. ``'Request'``).  When no pattern matches an empty
 dictionary is returned.
+
+When the optional ``hyperscan`` binding is installed all signatures are
+compiled into a single multi‑pattern database so that every piece of text is
+scanned once, regardless of the number of rules.  Patterns Hyperscan cannot
+compile, or every pattern when the binding is missing, are matched with the
+standard ``re`` module.
+
+Before any pattern runs, a cheap prefilter derived from the pattern syntax
+discards rules that cannot match: every rule carries its minimum match
+length and a set of literals one of which any match must contain.  The
+literals of all rules are searched in one sweep (with ``pyahocorasick`` when
+available) and only the surviving candidates are evaluated.  Rules that are
+nothing but a list of keywords (``\\b(cat|ls|...)\\b``) are matched by that
+sweep directly, with word boundaries checked around each hit.
+
+Signatures are compiled with ASCII semantics, which Hyperscan and the
+keyword sweep implement as well, so all matchers agree on any text.  Rules
+left to ``re`` are merged per threat into a single alternation of the
+candidates, so each text costs at most one search per threat type.
 """
 
 from __future__ import annotations
 import re
-import urllib.parse
+import threading
 import json
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 from .request import Request
 
+try:
+    import hyperscan  # optional: multi‑pattern matching in a single pass
+except ImportError:  # pragma: no cover - depends on the host
+    hyperscan = None
+
 # Precompile a handful of regular expressions for common attack categories.
 # These patterns are derived from the OWASP CRS but drastically simplified
-# for demonstration purposes.  They are case insensitive and will catch
-# obvious attempts; however, they are neither complete nor tuned to avoid
-# false positives.
+# for demonstration purposes.  They are case insensitive, use ASCII
+# semantics for ``\b``, ``\w`` and ``\s`` and will catch obvious
+# attempts; however, they are neither complete nor tuned to avoid false
+# positives.
 SIGNATURES: Dict[str, List[re.Pattern]] = {
     # SQL injection patterns
     'sqli': [
-        re.compile(r"(?:\bunion\b\s+select|\bselect\b.+\bfrom\b)", re.I),
-        re.compile(r"(?:\bdrop\b\s+table|\binsert\b\s+into|\bupdate\b\s+\w+\s+set)", re.I),
-        re.compile(r"(?:'\s*or\s*'\d+'='\d+'|'\s*or\s*1=1|\bor\b\s+1=1)", re.I),
+        re.compile(r"(?:\bunion\b\s+select|\bselect\b.+\bfrom\b)", re.I | re.ASCII),
+        re.compile(r"(?:\bdrop\b\s+table|\binsert\b\s+into|\bupdate\b\s+\w+\s+set)", re.I | re.ASCII),
+        re.compile(r"(?:'\s*or\s*'\d+'='\d+'|'\s*or\s*1=1|\bor\b\s+1=1)", re.I | re.ASCII),
         # detect semicolon or double dash comments which are typical in SQL injection.
         # The original pattern had an extra double quote which broke the string literal.
-        re.compile(r"(?:;\s*--|--\s*)", re.I),
-        re.compile(r"\b(benchmark|sleep|information_schema)\b", re.I),
+        re.compile(r"(?:;\s*--|--\s*)", re.I | re.ASCII),
+        re.compile(r"\b(benchmark|sleep|information_schema)\b", re.I | re.ASCII),
     ],
     # Cross‑site scripting patterns
     'xss': [
-        re.compile(r"<\s*script", re.I),
-        re.compile(r"<\s*img\b[^>]*\bonerror\b", re.I),
-        re.compile(r"javascript:\s*", re.I),
-        re.compile(r"onload\s*=", re.I),
-        re.compile(r"alert\s*\(", re.I),
+        re.compile(r"<\s*script", re.I | re.ASCII),
+        re.compile(r"<\s*img\b[^>]*\bonerror\b", re.I | re.ASCII),
+        re.compile(r"javascript:\s*", re.I | re.ASCII),
+        re.compile(r"onload\s*=", re.I | re.ASCII),
+        re.compile(r"alert\s*\(", re.I | re.ASCII),
     ],
     # Command injection patterns
     'cmdi': [
-        re.compile(r"(?:;|&&|\|\||\|)\s*\w+", re.I),
-        re.compile(r"`[^`]+`", re.I),
-        re.compile(r"\b(cat|ls|rm|wget|curl|whoami|powershell|cmd\.exe|sh)\b", re.I),
+        re.compile(r"(?:;|&&|\|\||\|)\s*\w+", re.I | re.ASCII),
+        re.compile(r"`[^`]+`", re.I | re.ASCII),
+        re.compile(r"\b(cat|ls|rm|wget|curl|whoami|powershell|cmd\.exe|sh)\b", re.I | re.ASCII),
     ],
     # Path traversal patterns
     'path-traversal': [
-        re.compile(r"\.\.\s*/", re.I),
-        re.compile(r"\.\.\\", re.I),
-        re.compile(r"(?:/|\\)etc(?:/|\\)passwd", re.I),
-        re.compile(r"web-inf|boot\.ini", re.I),
+        re.compile(r"\.\.\s*/", re.I | re.ASCII),
+        re.compile(r"\.\.\\", re.I | re.ASCII),
+        re.compile(r"(?:/|\\)etc(?:/|\\)passwd", re.I | re.ASCII),
+        re.compile(r"web-inf|boot\.ini", re.I | re.ASCII),
     ],
 }
 
-def _unquote(text: str) -> str:
-    """Repeatedly decode percent‑encoded text until it stops changing."""
-    k = 0
-    prev = text
-    while k < 5:  # limit recursion depth to avoid pathological cases
-        decoded = urllib.parse.unquote_plus(prev)
-        if decoded == prev:
-            break
-        prev = decoded
-        k += 1
-    return prev
+try:
+    import ahocorasick  # optional: single sweep for the prefilter literals
+except ImportError:  # pragma: no cover - depends on the host
+    ahocorasick = None
+
+try:  # Python 3.11+
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse
+
+
+def _required_literals(parsed) -> Optional[Set[str]]:
+    """Return lower‑case literals one of which every match must contain.
+
+    ``parsed`` is a pattern as produced by ``sre_parse``.  ``None`` means no
+    such set could be derived, in which case the rule is never skipped.
+    """
+    options: List[Set[str]] = []
+    run: List[str] = []
+
+    def close_run() -> None:
+        if run:
+            options.append({''.join(run)})
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av).lower())
+            continue
+        if op is sre_parse.AT:
+            continue  # zero width, the surrounding literals stay adjacent
+        close_run()
+        if op is sre_parse.SUBPATTERN:
+            inner = _required_literals(av[-1])
+        elif op is sre_parse.BRANCH:
+            branches = [_required_literals(branch) for branch in av[1]]
+            inner = None if None in branches else set().union(*branches)
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            inner = _required_literals(av[2])
+        else:
+            inner = None
+        if inner:
+            options.append(inner)
+    close_run()
+    if not options:
+        return None
+    # prefer the alternative whose shortest literal is the most selective
+    return max(options, key=lambda lits: min(len(lit) for lit in lits))
+
+
+def _expand_literals(items) -> Optional[List[str]]:
+    """Return every lower‑case string matched by a pure literal pattern.
+
+    Only literals, sets of literals, groups and alternations are accepted;
+    ``None`` is returned for anything else or when the language grows past
+    64 words.
+    """
+    words = ['']
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            alternatives = [chr(av).lower()]
+        elif op is sre_parse.IN:
+            # ``/|\\`` is parsed into the set ``[/\\]``
+            if not all(kind is sre_parse.LITERAL for kind, _ in av):
+                return None
+            alternatives = [chr(code).lower() for _, code in av]
+        elif op is sre_parse.SUBPATTERN:
+            alternatives = _expand_literals(av[-1])
+        elif op is sre_parse.BRANCH:
+            branches = [_expand_literals(branch) for branch in av[1]]
+            alternatives = None if None in branches else [w for branch in branches for w in branch]
+        else:
+            return None
+        if alternatives is None:
+            return None
+        words = [word + alt for word in words for alt in alternatives]
+        if len(words) > 64:
+            return None
+    return words
+
+
+def _keyword_family(parsed) -> Optional[Tuple[List[str], bool, bool]]:
+    """Recognise patterns that are a fixed set of keywords.
+
+    Returns ``(keywords, boundary_before, boundary_after)`` for patterns of
+    the form ``\\b?(kw1|kw2|...)\\b?`` and ``None`` otherwise.
+    """
+    items = list(parsed)
+    boundary = (sre_parse.AT, sre_parse.AT_BOUNDARY)
+    before = bool(items) and items[0] == boundary
+    after = len(items) > int(before) and items[-1] == boundary
+    words = _expand_literals(items[int(before):len(items) - int(after)])
+    if not words or not all(words):
+        return None
+    return words, before, after
+
+
+def _make_rule(threat: str, pat: re.Pattern) -> Tuple[str, int, Set[str], re.Pattern]:
+    parsed = sre_parse.parse(pat.pattern, pat.flags)
+    return threat, parsed.getwidth()[0], _required_literals(parsed) or set(), pat
+
+
+# Flat view of ``SIGNATURES`` used by the matchers below.  Each rule is a
+# ``(threat, min_len, required_literals, pattern)`` tuple; its index in
+# ``_RULES`` doubles as its Hyperscan expression id and its bit in the
+# candidate masks computed by ``_sweep``.
+_RULES: List[Tuple[str, int, Set[str], re.Pattern]] = [
+    _make_rule(threat, pat) for threat, patterns in SIGNATURES.items() for pat in patterns
+]
+
+# With an Aho‑Corasick automaton, rules that merely list keywords are
+# matched by the same sweep that computes the candidate mask.  Each keyword
+# maps to ``(threat, length, boundary_before, boundary_after)`` entries.
+_KEYWORDS: Dict[str, List[Tuple[str, int, bool, bool]]] = {}
+_KEYWORD_RULES: Set[int] = set()
+if ahocorasick is not None:
+    for _idx, (_threat, _, _, _pat) in enumerate(_RULES):
+        _family = _keyword_family(sre_parse.parse(_pat.pattern, _pat.flags))
+        if _family is None:
+            continue
+        _KEYWORD_RULES.add(_idx)
+        for _word in _family[0]:
+            _KEYWORDS.setdefault(_word, []).append((_threat, len(_word), _family[1], _family[2]))
+
+# Rules without required literals are always candidates.
+_UNCONDITIONAL = sum(
+    1 << idx for idx, rule in enumerate(_RULES) if not rule[2] and idx not in _KEYWORD_RULES
+)
+# Map every required literal to the mask of rules it keeps alive.  Keyword
+# rules are matched by the sweep itself and only run as regular expressions
+# on text the sweep cannot handle.
+_LITERALS: Dict[str, int] = {}
+for _idx, (_, _, _lits, _) in enumerate(_RULES):
+    if _idx in _KEYWORD_RULES:
+        continue
+    for _lit in _lits:
+        _LITERALS[_lit] = _LITERALS.get(_lit, 0) | 1 << _idx
+
+if ahocorasick is not None and (_LITERALS or _KEYWORDS):
+    _AUTOMATON = ahocorasick.Automaton()
+    for _word in _LITERALS.keys() | _KEYWORDS.keys():
+        _AUTOMATON.add_word(_word, (_LITERALS.get(_word, 0), tuple(_KEYWORDS.get(_word, ()))))
+    _AUTOMATON.make_automaton()
+else:
+    _AUTOMATON = None
+
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+
+def _at_boundary(text: str, pos: int) -> bool:
+    """``\\b`` at ``pos`` of an ASCII ``text``."""
+    return (pos > 0 and text[pos - 1] in _WORD_CHARS) != (pos < len(text) and text[pos] in _WORD_CHARS)
+
+
+def _sweep(text: str, location: str, threats: Dict[str, str]) -> int:
+    """Return the mask of rules that may match the lower‑cased ``text``.
+
+    A rule is discarded only when none of its required literals occurs in
+    the text.  Keyword rules found by the automaton are recorded in
+    ``threats`` directly.
+    """
+    mask = _UNCONDITIONAL
+    if _AUTOMATON is not None:
+        for end, (bits, keywords) in _AUTOMATON.iter(text):
+            mask |= bits
+            for threat, size, before, after in keywords:
+                if threat in threats:
+                    continue
+                if before and not _at_boundary(text, end - size + 1):
+                    continue
+                if after and not _at_boundary(text, end + 1):
+                    continue
+                threats[threat] = location
+    else:
+        for lit, bits in _LITERALS.items():
+            if bits & ~mask and lit in text:
+                mask |= bits
+    return mask
+
+
+def _build_database(rules: List[Tuple[str, int, Set[str], re.Pattern]], indices: List[int]):
+    """Compile the given rules into one Hyperscan block‑mode database.
+
+    Patterns rejected by Hyperscan are left to the ``re`` module.  Returns
+    the database (or ``None``), the mask of the rules it contains and the
+    indices of the fallback rules.
+    """
+    if hyperscan is None:
+        return None, 0, list(indices)
+    flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+    accepted: List[int] = []
+    fallback: List[int] = []
+    for idx in indices:
+        probe = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        try:
+            probe.compile(expressions=[rules[idx][3].pattern.encode()], ids=[idx], flags=[flags])
+        except hyperscan.error:
+            fallback.append(idx)
+        else:
+            accepted.append(idx)
+    if not accepted:
+        return None, 0, fallback
+    db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    db.compile(
+        expressions=[rules[idx][3].pattern.encode() for idx in accepted],
+        ids=accepted,
+        flags=[flags] * len(accepted),
+    )
+    return db, sum(1 << idx for idx in accepted), fallback
+
+
+_HS_DB, _HS_RULES, _RE_RULES = _build_database(
+    _RULES, [idx for idx in range(len(_RULES)) if idx not in _KEYWORD_RULES]
+)
+_local = threading.local()
+
+# The ``re`` rules grouped by threat as ``(threat, [(index, min_len), ...])``.
+_RE_FAMILIES: List[Tuple[str, List[Tuple[int, int]]]] = []
+for _idx in _RE_RULES:
+    _threat, _min_len = _RULES[_idx][:2]
+    if not _RE_FAMILIES or _RE_FAMILIES[-1][0] != _threat:
+        _RE_FAMILIES.append((_threat, []))
+    _RE_FAMILIES[-1][1].append((_idx, _min_len))
+
+# Alternations of candidate rules of one threat, keyed by their rule mask.
+_COMBINED: Dict[int, re.Pattern] = {}
+
+
+def _combined(bits: int) -> re.Pattern:
+    """Return one pattern matching wherever any rule in ``bits`` matches."""
+    pat = _COMBINED.get(bits)
+    if pat is None:
+        members = [_RULES[idx][3] for idx in range(len(_RULES)) if bits >> idx & 1]
+        if len(members) == 1:
+            pat = members[0]
+        else:
+            pat = re.compile('|'.join(f'(?:{m.pattern})' for m in members), members[0].flags)
+        _COMBINED[bits] = pat
+    return pat
+
+
+def _scratch():
+    """Return the Hyperscan scratch space owned by the current thread."""
+    scratch = getattr(_local, 'scratch', None)
+    if scratch is None:
+        scratch = _local.scratch = hyperscan.Scratch(_HS_DB)
+    return scratch
+
 
+def _scan_text(text: str, location: str, threats: Dict[str, str]) -> None:
+    """Record in ``threats`` every not yet seen threat matching ``text``."""
+    mask = _sweep(text, location, threats)
+    if mask & _HS_RULES and len(threats) < len(SIGNATURES):
+        def on_match(idx, start, end, flags, context):
+            threat = _RULES[idx][0]
+            if threat not in threats:
+                threats[threat] = location
+            # a non‑zero return value stops the scan once every label is set
+            return len(threats) == len(SIGNATURES)
 
-def _clean(text: str) -> str:
-    """Normalise a piece of text for signature matching."""
-    if text is None:
-        return ''
-    # unquote and lower‑case
-    t = _unquote(text)
-    t = ' '.join(t.strip().split())  # collapse whitespace
-    return t.lower()
+        try:
+            _HS_DB.scan(text.encode('utf-8', 'surrogatepass'), match_event_handler=on_match, scratch=_scratch())
+        except hyperscan.ScanTerminated:
+            pass  # ``on_match`` stopped the scan early
+    length = len(text)
+    for threat, family in _RE_FAMILIES:
+        if threat in threats:
+            continue
+        bits = 0
+        for idx, min_len in family:
+            if mask >> idx & 1 and length >= min_len:
+                bits |= 1 << idx
+        if bits and _combined(bits).search(text):
+            threats[threat] = location
+            if len(threats) == len(SIGNATURES):
+                return
 
 
 def scan_request(req: Request) -> Dict[str, str]:
@@ -94,35 +374,27 @@ def scan_request(req: Request) -> Dict[str, str]:
     # Prepare list of (text, location) tuples to scan
     to_scan: List[tuple] = []
     if req.request:
-        to_scan.append((_clean(req.request), 'Request'))
+        to_scan.append((req.request_clean, 'Request'))
     if req.body:
-        to_scan.append((_clean(req.body), 'Body'))
+        to_scan.append((req.body_clean, 'Body'))
     # Inspect cookies and user‑agent / encoding headers
     for header in ['Cookie', 'User_Agent', 'Accept_Encoding', 'Accept_Language']:
-        value = req.headers.get(header)
-        if value:
-            to_scan.append((_clean(value), header.replace('_', ' ')))
+        if req.headers.get(header):
+            to_scan.append((req.header_clean(header), header.replace('_', ' ')))
     # Signature matching
     for text, location in to_scan:
-        for threat, patterns in SIGNATURES.items():
-            if threat in threats:
-                continue  # already recorded
-            for pat in patterns:
-                if pat.search(text):
-                    threats[threat] = location
-                    break
+        if len(threats) == len(SIGNATURES):
+            break  # every signature label is already set
+        _scan_text(text, location, threats)
     # Parameter tampering: parse query and body parameters; if any value > 100
-    try:
-        query_params = urllib.parse.parse_qs(_clean(req.request or ''))
-    except Exception:
-        query_params = {}
+    query_params = req.query_params
     body_params: Dict[str, List[str]] = {}
     if req.body:
         # attempt URL decoding first
-        bclean = _clean(req.body)
-        body_params = urllib.parse.parse_qs(bclean)
+        body_params = req.body_params
         if not body_params:
             # try json
+            body_params = {}
             try:
                 obj = json.loads(req.body)
                 for k, v in obj.items():
@@ -2,12 +2,18 @@
 
 This script uses Scapy to sniff incoming HTTP requests on a given port.  For
 each observed request a `Request` object is created, populated with
-metadata, classified via `ThreatClassifier` and persisted to the SQLite
-database through `DBController`.  Run with administrative privileges
-because raw packet capture requires elevated permissions on most systems.
+metadata and queued.  A worker thread classifies the queued requests in
+batches via `ThreatClassifier` and hands them to `DBController`, whose
+writer thread persists them to the SQLite database in bulk, so neither
+inference nor disk I/O runs on the capture path.  Run with administrative
+privileges because raw packet capture requires elevated permissions on most
+systems.
 """
 
 from __future__ import annotations
+import logging
+import queue
+import threading
 import urllib.parse
 from argparse import ArgumentParser
 
@@ -17,14 +23,53 @@ from scapy.layers.http import HTTPRequest, HTTP
 from scapy.layers.inet import IP, TCP
 from scapy.sessions import TCPSession
 
+from .batching import drain
 from .request import Request, DBController
 from .classifier import ThreatClassifier
 
+logger = logging.getLogger(__name__)
+
+# Seconds shutdown waits for the worker to accept and process the stop signal
+SHUTDOWN_TIMEOUT = 10.0
+
+# Headers extracted from every request
+HEADER_FIELDS = frozenset([
+    'Http_Version', 'A_IM', 'Accept', 'Accept_Charset', 'Accept_Datetime',
+    'Accept_Encoding', 'Accept_Language', 'Access_Control_Request_Headers',
+    'Access_Control_Request_Method', 'Authorization', 'Cache_Control',
+    'Connection', 'Content_Length', 'Content_MD5', 'Content_Type', 'Cookie',
+    'DNT', 'Date', 'Expect', 'Forwarded', 'From', 'Front_End_Https',
+    'If_Match', 'If_Modified_Since', 'If_None_Match', 'If_Range',
+    'If_Unmodified_Since', 'Keep_Alive', 'Max_Forwards', 'Origin',
+    'Permanent', 'Pragma', 'Proxy_Authorization', 'Proxy_Connection', 'Range',
+    'Referer', 'Save_Data', 'TE', 'Upgrade', 'Upgrade_Insecure_Requests',
+    'User_Agent', 'Via', 'Warning', 'X_ATT_DeviceId', 'X_Correlation_ID',
+    'X_Csrf_Token', 'X_Forwarded_For', 'X_Forwarded_Host',
+    'X_Forwarded_Proto', 'X_Http_Method_Override', 'X_Request_ID',
+    'X_Requested_With', 'X_UIDH', 'X_Wap_Profile'
+])
+
+
+def get_header(http_req: HTTPRequest) -> dict:
+    """Return the known headers present in the request."""
+    headers: dict = {}
+    # ``fields`` only holds the fields set while dissecting the packet
+    for field, value in http_req.fields.items():
+        if field in HEADER_FIELDS and value and value != 'None':
+            # decode bytes to string
+            try:
+                headers[field] = value.decode()
+            except AttributeError:
+                headers[field] = str(value)
+    return headers
+
 
 def main() -> None:
     parser = ArgumentParser(description="Simple WAF packet sniffer")
     parser.add_argument('--port', type=int, default=5000, help='Port to sniff')
     parser.add_argument('--iface', type=str, default='lo', help='Interface to sniff on')
+    parser.add_argument('--max-batch-size', type=int, default=64, help='Maximum number of requests classified at once')
+    parser.add_argument('--max-batch-duration', type=float, default=0.02, help='Maximum time in seconds a request waits for its batch')
     args = parser.parse_args()
 
     # Bind HTTP layer to the specified port for both directions
@@ -33,57 +78,72 @@ def main() -> None:
 
     db = DBController()
     threat_clf = ThreatClassifier()
-
-    # Define which headers to extract
-    header_fields = [
-        'Http_Version', 'A_IM', 'Accept', 'Accept_Charset', 'Accept_Datetime',
-        'Accept_Encoding', 'Accept_Language', 'Access_Control_Request_Headers',
-        'Access_Control_Request_Method', 'Authorization', 'Cache_Control',
-        'Connection', 'Content_Length', 'Content_MD5', 'Content_Type', 'Cookie',
-        'DNT', 'Date', 'Expect', 'Forwarded', 'From', 'Front_End_Https',
-        'If_Match', 'If_Modified_Since', 'If_None_Match', 'If_Range',
-        'If_Unmodified_Since', 'Keep_Alive', 'Max_Forwards', 'Origin',
-        'Permanent', 'Pragma', 'Proxy_Authorization', 'Proxy_Connection', 'Range',
-        'Referer', 'Save_Data', 'TE', 'Upgrade', 'Upgrade_Insecure_Requests',
-        'User_Agent', 'Via', 'Warning', 'X_ATT_DeviceId', 'X_Correlation_ID',
-        'X_Csrf_Token', 'X_Forwarded_For', 'X_Forwarded_Host',
-        'X_Forwarded_Proto', 'X_Http_Method_Override', 'X_Request_ID',
-        'X_Requested_With', 'X_UIDH', 'X_Wap_Profile'
-    ]
-
-    def get_header(packet: scapy.packet.Packet) -> dict:
-        headers: dict = {}
-        for field in header_fields:
-            value = getattr(packet[HTTPRequest], field)
-            if value and value != 'None':
-                # decode bytes to string
-                headers[field] = value.decode() if isinstance(value, bytes) else str(value)
-        return headers
+    # Captured requests waiting for classification.  ``None`` tells the
+    # worker to stop.
+    pending: queue.Queue = queue.Queue(maxsize=16 * args.max_batch_size)
+    # Requests dropped because the worker fell behind.  Only the capture
+    # thread updates it.
+    dropped = 0
 
     def sniffing_function(packet: scapy.packet.Packet) -> None:
+        nonlocal dropped
         # Only process HTTP requests
         if packet.haslayer(HTTPRequest):
+            http_req = packet[HTTPRequest]
             req = Request()
             # Source IP
             req.origin = packet[IP].src if packet.haslayer(IP) else 'localhost'
-            req.host = urllib.parse.unquote(packet[HTTPRequest].Host.decode())
-            req.request = urllib.parse.unquote(packet[HTTPRequest].Path.decode())
-            req.method = packet[HTTPRequest].Method.decode()
-            req.headers = get_header(packet)
+            req.host = urllib.parse.unquote(http_req.Host.decode())
+            req.request = urllib.parse.unquote(http_req.Path.decode())
+            req.method = http_req.Method.decode()
+            req.headers = get_header(http_req)
             # Body
             if packet.haslayer(Raw):
                 try:
                     req.body = packet[Raw].load.decode()
                 except Exception:
                     req.body = ''
-            # Classify and persist
-            threat_clf.classify_request(req)
-            db.save(req)
+            try:
+                # never block the capture thread on a stalled worker
+                pending.put_nowait(req)
+            except queue.Full:
+                dropped += 1
+                if dropped == 1 or dropped % 1000 == 0:
+                    logger.warning("Classification queue full, %d requests dropped so far", dropped)
+
+    def classification_worker() -> None:
+        while True:
+            batch = drain(pending, args.max_batch_size, args.max_batch_duration)
+            stop = batch[-1] is None
+            reqs = batch[:-1] if stop else batch
+            if reqs:
+                try:
+                    threat_clf.classify_batch(reqs)
+                    for req in reqs:
+                        db.save(req)
+                except Exception:
+                    logger.exception("Failed to classify or save a batch of %d requests", len(reqs))
+            if stop:
+                return
+
+    worker = threading.Thread(target=classification_worker, daemon=True)
+    worker.start()
 
-    # Start sniffing
+    # Start sniffing once the models are warmed up
+    logging.basicConfig(level=logging.INFO)
+    threat_clf.ready.wait()
     try:
         sniff(prn=sniffing_function, iface=args.iface, filter='port ' + str(args.port) + ' and inbound', session=TCPSession)
     finally:
+        # flush the requests still in flight before exiting
+        try:
+            pending.put(None, timeout=SHUTDOWN_TIMEOUT)
+        except queue.Full:
+            logger.error("Classification worker is not draining, %d queued requests are lost", pending.qsize())
+        else:
+            worker.join(SHUTDOWN_TIMEOUT)
+        if dropped:
+            logger.warning("%d requests were dropped because the classification queue was full", dropped)
         db.close()
 
 